@@ -1,13 +1,17 @@
 import os
+import hashlib
 import pydicom
 from collections import defaultdict
 from tqdm import tqdm
-from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures import ProcessPoolExecutor
 import argparse
 
+# Only these elements are parsed from each file
+DUPLICATE_TAGS = ["SeriesDescription", "SeriesNumber", "PatientID", "StudyDate", "SliceLocation"]
+
 def get_dicom_attributes(dicom_file):
     """Get relevant DICOM attributes to check for duplicates."""
-    ds = pydicom.dcmread(dicom_file)
+    ds = pydicom.dcmread(dicom_file, stop_before_pixels=True, specific_tags=DUPLICATE_TAGS)
     attributes = {
         "SeriesDescription": ds.SeriesDescription,
         "SeriesNumber": ds.SeriesNumber,
@@ -17,40 +21,61 @@ def get_dicom_attributes(dicom_file):
     }
     return attributes
 
+def get_identifier(file_path):
+    """Get the tuple of attributes identifying duplicates of a DICOM file."""
+    return tuple(get_dicom_attributes(file_path).values())
+
+def get_fingerprint(identifier):
+    """Hash an identifier into a compact 8-byte fingerprint, used as the lookup key while scanning."""
+    # Numbers (IS/DS) are hashed by value, as they compare equal by value in the tuple;
+    # adding 0.0 turns -0.0 into 0.0, since "-0.0" and "0" compare equal too
+    parts = [str(float(value) + 0.0) if isinstance(value, (int, float)) else str(value) for value in identifier]
+    return hashlib.blake2b("\0".join(parts).encode(), digest_size=8).digest()
+
 def process_file(file_path):
-    """Process a single DICOM file and return its attributes and path."""
+    """Process a single DICOM file and return its fingerprint, attributes and path."""
     try:
-        attributes = get_dicom_attributes(file_path)
-        identifier = tuple(attributes.values())
-        return identifier, file_path
+        identifier = get_identifier(file_path)
+        return get_fingerprint(identifier), identifier, file_path
     except Exception as e:
         print(f"Error reading {file_path}: {e}")
         return None
 
+def iter_files(directory, extension=''):
+    """Recursively yield the paths of all files under directory with the given extension, using os.scandir."""
+    try:
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    yield from iter_files(entry.path, extension)
+                elif entry.name.lower().endswith(extension) and entry.is_file():
+                    yield entry.path
+    except OSError:
+        return
+
 def find_duplicates(root_folder):
     dicom_identifiers = defaultdict(list)
-    total_files = sum([len(files) for _, _, files in os.walk(root_folder) if any(file.lower().endswith('.dcm') for file in files)])
+    # Attributes of the first file seen per fingerprint, to check later files against and to report
+    first_identifiers = {}
+    # Files whose fingerprint collides with different attributes, grouped by the attributes themselves
+    collisions = defaultdict(list)
 
     # Collect all DICOM file paths
-    dicom_files = []
-    for subdir, _, files in os.walk(root_folder):
-        for file in files:
-            if file.lower().endswith('.dcm'):
-                file_path = os.path.join(subdir, file)
-                dicom_files.append(file_path)
-
-    with tqdm(total=total_files, desc="Processing DICOM files") as pbar:
-        with ProcessPoolExecutor() as executor:
-            future_to_file = {executor.submit(process_file, file_path): file_path for file_path in dicom_files}
-
-            for future in as_completed(future_to_file):
-                result = future.result()
+    dicom_files = list(iter_files(root_folder, '.dcm'))
+
+    with ProcessPoolExecutor() as executor:
+        with tqdm(total=len(dicom_files), desc="Processing DICOM files") as pbar:
+            for result in executor.map(process_file, dicom_files, chunksize=64):
                 if result:
-                    identifier, file_path = result
-                    dicom_identifiers[identifier].append(file_path)
+                    fingerprint, identifier, file_path = result
+                    if first_identifiers.setdefault(fingerprint, identifier) == identifier:
+                        dicom_identifiers[fingerprint].append(file_path)
+                    else:
+                        collisions[identifier].append(file_path)
                 pbar.update(1)
 
-    duplicates = {k: v for k, v in dicom_identifiers.items() if len(v) > 1}
+    duplicates = {first_identifiers[k]: v for k, v in dicom_identifiers.items() if len(v) > 1}
+    duplicates.update({k: v for k, v in collisions.items() if len(v) > 1})
     return duplicates
 
 def map_duplicates(duplicates):
@@ -2,12 +2,12 @@ import os
 import pydicom
 from collections import defaultdict
 from tqdm import tqdm
-from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures import ProcessPoolExecutor
 import argparse
 
 def get_dicom_identifier(dicom_file):
     """Get the SOPInstanceUID from a DICOM file to check for duplicates."""
-    ds = pydicom.dcmread(dicom_file)
+    ds = pydicom.dcmread(dicom_file, stop_before_pixels=True, specific_tags=["SOPInstanceUID"])
     sop_instance_uid = ds.SOPInstanceUID
     return sop_instance_uid
 
@@ -20,24 +20,27 @@ def process_file(file_path):
         print(f"Error reading {file_path}: {e}")
         return None
 
+def iter_files(directory, extension=''):
+    """Recursively yield the paths of all files under directory with the given extension, using os.scandir."""
+    try:
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    yield from iter_files(entry.path, extension)
+                elif entry.name.lower().endswith(extension) and entry.is_file():
+                    yield entry.path
+    except OSError:
+        return
+
 def find_duplicates(root_folder):
     dicom_identifiers = defaultdict(list)
-    total_files = sum([len(files) for _, _, files in os.walk(root_folder) if any(file.lower().endswith('.dcm') for file in files)])
 
     # Collect all DICOM file paths
-    dicom_files = []
-    for subdir, _, files in os.walk(root_folder):
-        for file in files:
-            if file.lower().endswith('.dcm'):
-                file_path = os.path.join(subdir, file)
-                dicom_files.append(file_path)
+    dicom_files = list(iter_files(root_folder, '.dcm'))
 
-    with tqdm(total=total_files, desc="Processing DICOM files") as pbar:
+    with tqdm(total=len(dicom_files), desc="Processing DICOM files") as pbar:
         with ProcessPoolExecutor() as executor:
-            future_to_file = {executor.submit(process_file, file_path): file_path for file_path in dicom_files}
-
-            for future in as_completed(future_to_file):
-                result = future.result()
+            for result in executor.map(process_file, dicom_files, chunksize=64):
                 if result:
                     sop_uid, file_path = result
                     dicom_identifiers[sop_uid].append(file_path)
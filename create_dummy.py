@@ -1,8 +1,14 @@
 import csv
 import argparse
 import json
+import re
 from collections import defaultdict
 
+try:
+    import ahocorasick  # Optional: pyahocorasick, scans for all substrings in a single pass
+except ImportError:
+    ahocorasick = None
+
 def parse_criteria_json(criteria_json):
     """
     Parses the JSON string specifying the series descriptions and any OR conditions.
@@ -13,12 +19,65 @@ def parse_criteria_json(criteria_json):
     except json.JSONDecodeError as e:
         raise ValueError(f"Invalid JSON format: {e}")
 
+def compile_criteria(criteria):
+    """
+    Compiles the substring(s) of each dummy into a single regular expression, so each
+    series description is matched once per dummy instead of once per substring.
+    """
+    patterns = {}
+    for dummy, conditions in criteria.items():
+        if not isinstance(conditions, list):
+            conditions = [conditions]
+        # An empty OR condition never matches
+        patterns[dummy] = re.compile("|".join(map(re.escape, conditions))) if conditions else None
+    return patterns
+
+def build_matcher(criteria):
+    """
+    Returns a function mapping a series description to the set of dummies it matches.
+    Uses an Aho-Corasick automaton when pyahocorasick is installed, so the description is
+    scanned once for all substrings; otherwise falls back to one regex per dummy.
+    """
+    if ahocorasick is None:
+        patterns = compile_criteria(criteria)
+        return lambda text: {dummy for dummy, pattern in patterns.items()
+                             if pattern is not None and pattern.search(text)}
+
+    # Map every substring to the dummies that use it, as substrings may be shared
+    needles = defaultdict(set)
+    always = set()  # An empty substring matches every description
+    for dummy, conditions in criteria.items():
+        if not isinstance(conditions, list):
+            conditions = [conditions]
+        for crit in conditions:
+            if crit:
+                needles[crit].add(dummy)
+            else:
+                always.add(dummy)
+
+    if not needles:
+        return lambda text: set(always)
+
+    automaton = ahocorasick.Automaton()
+    for crit, dummies in needles.items():
+        automaton.add_word(crit, frozenset(dummies))
+    automaton.make_automaton()
+
+    def match(text):
+        hits = set(always)
+        for _, dummies in automaton.iter(text):
+            hits.update(dummies)
+        return hits
+
+    return match
+
 def create_dummy_table_from_tsv(input_tsv_path, criteria_json):
     """
     Reads an existing TSV file to create a dummy table based on complex criteria.
     """
     patient_series = defaultdict(lambda: defaultdict(int))
     criteria = parse_criteria_json(criteria_json)
+    match = build_matcher(criteria)
 
     with open(input_tsv_path, 'r', newline='') as tsvfile:
         reader = csv.DictReader(tsvfile, delimiter='\t')
@@ -26,12 +85,8 @@ def create_dummy_table_from_tsv(input_tsv_path, criteria_json):
             patient_id = row.get("Patient ID", "")
             series_description = row.get("Series Description", "")
             
-            for dummy, conditions in criteria.items():
-                if isinstance(conditions, list):  # OR condition
-                    if any(crit in series_description for crit in conditions):
-                        patient_series[patient_id][dummy] += 1
-                elif conditions in series_description:
-                    patient_series[patient_id][dummy] += 1
+            for dummy in match(series_description):
+                patient_series[patient_id][dummy] += 1
 
     columns = ["Patient ID"] + list(criteria.keys())
     output_dummy_path = input_tsv_path.replace('.tsv', '_dummy.tsv')
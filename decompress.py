@@ -1,55 +1,149 @@
 import os
 import subprocess
 import argparse
+import tempfile
+import pydicom
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from functools import partial
+from itertools import islice
+from pydicom.filereader import read_file_meta_info
 from tqdm import tqdm
-from shutil import which
+from shutil import copymode, which
 
 def is_tool_available(name):
     """Check if tool is available in PATH and executable."""
     return which(name) is not None
 
-def decompress_file(file_path):
+DCMDJPEG_AVAILABLE = is_tool_available("dcmdjpeg")
+
+def needs_decompression(file_path):
+    """Check the Transfer Syntax in the file meta header to see if the file is compressed."""
+    file_meta = read_file_meta_info(file_path)
+    transfer_syntax = file_meta.get("TransferSyntaxUID")
+    # Without a Transfer Syntax we can't tell, so try to decompress it anyway
+    return transfer_syntax is None or transfer_syntax.is_compressed
+
+def decompress_with_dcmdjpeg(file_path):
+    """Fallback for files the installed pydicom pixel data handlers can't decode."""
+    if not DCMDJPEG_AVAILABLE:
+        return False
     try:
         # Attempt to decompress the file, overwriting the original
-        subprocess.run(["dcmdjpeg", file_path, file_path], check=True)
+        # Output is discarded so a chatty dcmdjpeg can't block on a full pipe
+        subprocess.run(["dcmdjpeg", file_path, file_path], check=True,
+                       stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
         return True  # Return True if successful
     except subprocess.CalledProcessError:
         # This error is raised for non-DICOM files or other failures
         return False  # Return False on failure
 
-def walk_and_process(directory):
-    # Collect all files to process to calculate the progress
-    file_paths = []
-    for root, _, files in os.walk(directory):
-        for file in files:
-            file_paths.append(os.path.join(root, file))
-
-    # Initialize the progress bar
-    progress_bar = tqdm(file_paths, desc="Decompressing files", unit="file")
-    for file_path in progress_bar:
-        result = decompress_file(file_path)
-        # Update the description on the progress bar
-        progress_bar.set_description(f"Processing {os.path.basename(file_path)}")
-        progress_bar.set_postfix(success=result)
+def save_in_place(ds, file_path):
+    """Overwrite file_path with ds without ever leaving a truncated file behind."""
+    # Write to a temporary file in the same directory, then swap it over the original in one step
+    fd, temp_path = tempfile.mkstemp(suffix='.tmp', dir=os.path.dirname(file_path))
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            ds.save_as(f)
+        copymode(file_path, temp_path)
+        os.replace(temp_path, file_path)
+    except BaseException:
+        os.remove(temp_path)
+        raise
+
+def decompress_file(file_path, decoder=''):
+    try:
+        # Only the file meta header is read, so uncompressed files are never fully loaded
+        if not needs_decompression(file_path):
+            return True  # Already uncompressed, nothing to do
+        ds = pydicom.dcmread(file_path)
+    except Exception:
+        # Not a DICOM file, or its header is unreadable or damaged (pydicom raises
+        # InvalidDicomError, OSError, ValueError, ... depending on the damage)
+        return False
+
+    try:
+        # Decode in-process and overwrite the original
+        # An empty name lets pydicom pick any available handler. Keep the SOP Instance UID, as
+        # dcmdjpeg does, so references from other objects and UID-based duplicate checks still hold.
+        ds.decompress(decoding_plugin=decoder, generate_instance_uid=False)
+    except (RuntimeError, NotImplementedError, ValueError):
+        # No suitable pixel data handler installed (or decoding failed)
+        return decompress_with_dcmdjpeg(file_path)
+
+    try:
+        save_in_place(ds, file_path)
+        return True
+    except OSError:
+        # e.g. a read-only file or directory
+        return False
+
+def iter_files(directory, extension=''):
+    """Recursively yield the paths of all files under directory with the given extension, using os.scandir."""
+    try:
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    yield from iter_files(entry.path, extension)
+                elif entry.name.lower().endswith(extension) and entry.is_file():
+                    yield entry.path
+    except OSError:
+        return
+
+def walk_and_process(directory, decoder=''):
+    # Count the files to calculate the progress, without holding every path in memory
+    total_files = sum(1 for _ in iter_files(directory))
+    worker = partial(decompress_file, decoder=decoder)
+    # Only a few files per core are queued at a time, so memory doesn't grow with the tree
+    max_in_flight = 4 * (os.cpu_count() or 1)
+
+    # Decoding is CPU-bound, so spread it over processes. The default pool already uses one
+    # worker per core (no thread-pool cap of 32), and stays within Windows' 61-worker limit.
+    # The progress bar only redraws every 100 files / 0.5 s, so it stays out of the hot loop
+    with ProcessPoolExecutor() as executor, \
+            tqdm(total=total_files, desc="Decompressing files", unit="file",
+                 mininterval=0.5, miniters=100) as progress_bar:
+        file_paths = iter_files(directory)
+        failed = 0
+        in_flight = {executor.submit(worker, file_path) for file_path in islice(file_paths, max_in_flight)}
+        while in_flight:
+            done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                # Re-raise unexpected worker errors, and count the files left compressed
+                if not future.result():
+                    failed += 1
+                # Refill the window as files complete
+                next_path = next(file_paths, None)
+                if next_path is not None:
+                    in_flight.add(executor.submit(worker, next_path))
+            # One update per batch of completions rather than per file
+            progress_bar.update(len(done))
+
+    if failed:
+        print(f"{failed} of {total_files} files could not be decompressed and were left unchanged.")
 
 def main():
     parser = argparse.ArgumentParser(description='Recursively decompress DICOM files in a directory tree.')
     parser.add_argument('path', type=str, help='Path to the directory to process.')
+    parser.add_argument('--decoder', choices=['pylibjpeg', 'gdcm'], default='',
+                        help='pydicom pixel data handler to decode with (default: any available).')
     args = parser.parse_args()
 
-    # Check if dcmdjpeg is available in PATH
-    if not is_tool_available("dcmdjpeg"):
-        print("Error: 'dcmdjpeg' is not available on the system's PATH.")
-        print("Please ensure that DCMTK is installed and 'dcmdjpeg' is added to the PATH.")
+    # The decoding_plugin and generate_instance_uid arguments of Dataset.decompress() are new in pydicom 3
+    if int(pydicom.__version__.split('.')[0]) < 3:
+        parser.error(f"pydicom>=3.0 is required, found {pydicom.__version__}")
+
+    # dcmdjpeg is only needed for files pydicom can't decode itself
+    if not DCMDJPEG_AVAILABLE:
+        print("Warning: 'dcmdjpeg' is not available on the system's PATH.")
+        print("Files that the installed pydicom pixel data handlers can't decode will be left compressed.")
         print("DCMTK can be downloaded from: https://dicom.offis.de/dcmtk.php.en")
-        return  # Exit the script if the required tool is not found
 
     # Change to specified directory
     os.chdir(args.path)
     print(f"Current working directory set to: {os.getcwd()}")
 
     # Start processing
-    walk_and_process(os.getcwd())
+    walk_and_process(os.getcwd(), args.decoder)
 
 if __name__ == "__main__":
     main()
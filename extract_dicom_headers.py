@@ -1,44 +1,125 @@
 import os
 import argparse
 import pydicom
+from pydicom.errors import InvalidDicomError
+from pydicom.tag import Tag
 import csv
-from collections import OrderedDict, defaultdict
+from collections import defaultdict, deque
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from itertools import islice
 from tqdm import tqdm
 
-def find_dicom_files(directory, read_all):
-    for root, dirs, files in os.walk(directory):
-        dicom_files = [os.path.join(root, f) for f in files if f.endswith('.dcm') or '.' not in f]
-        if not read_all:
-            dicom_files = dicom_files[:5]  # Limit to first 5 files if not reading all
-        for file_path in dicom_files:
-            yield file_path
+def is_dicom_file(file_path):
+    """Check for the 'DICM' prefix after the 128-byte preamble, without parsing the file."""
+    try:
+        with open(file_path, 'rb') as f:
+            f.seek(128)
+            return f.read(4) == b'DICM'
+    except OSError:
+        return False
+
+def find_dicom_files(directory, read_all, fast_sample=False):
+    try:
+        with os.scandir(directory) as it:
+            entries = list(it)
+    except OSError:
+        return
+
+    candidates = (e.path for e in entries if e.is_file() and (e.name.endswith('.dcm') or '.' not in e.name))
+    if read_all:
+        # Stray non-DICOM files are rejected by the read in the worker processes
+        dicom_files = candidates
+    else:
+        # Limit to first 5 files if not reading all, or to a single file per folder when fast
+        # sampling (PACS exports usually keep one series per folder). Stray files without an
+        # extension are checked for up front here so they don't take up one of those slots.
+        dicom_files = islice(filter(is_dicom_file, candidates), 1 if fast_sample else 5)
+    for file_path in dicom_files:
+        yield file_path
+
+    # Then descend into subdirectories, in the same top-down order as os.walk
+    for entry in entries:
+        if entry.is_dir(follow_symlinks=False):
+            yield from find_dicom_files(entry.path, read_all, fast_sample)
+
+# Number of paths handed to the worker pool at a time
+FILE_BATCH_SIZE = 4096
+
+# Binary VRs never hold a value worth exporting to the TSV, and stringifying them is costly
+BINARY_VRS = {'OB', 'OD', 'OF', 'OL', 'OV', 'OW', 'UN'}
+
+def element_to_str(elem):
+    if elem.VR in BINARY_VRS:
+        return ''
+    value = elem.value
+    # Text values are already strings, so skip the str() round trip
+    return value if isinstance(value, str) else str(value)
 
 def hex_string_to_tag(hex_str):
     group, element = hex_str[:4], hex_str[4:]
     return (int(group, 16), int(element, 16))
 
-def extract_dicom_info(file_path, fields):
+# Define a mapping from DICOM tags to descriptive names
+DICOM_FIELD_MAPPING = {
+    "00100020": "Patient ID",
+    "00080020": "Study Date",
+    "00180087": "Magnetic Field Strength",
+    "00081090": "Manufacturer's Model Name",
+    "00080080": "Institution Name",
+    "00080050": "Accession Number",
+    "0020000D": "Study Instance UID",
+    "00200011": "Series Number",
+    "0008103E": "Series Description",
+    "0020000E": "Series Instance UID",
+    "00540081": "Number of Slices",
+    "00181310": "Acquisition Matrix",
+    "00280030": "Pixel Spacing",
+    "00180088": "Spacing Between Slices",
+    "00180050": "Slice Thickness",
+    "00180080": "Repetition Time",
+    "00180081": "Echo Time",
+    "00180086": "Echo Number(s)",
+    "00180091": "Echo Train Length",
+    "00180082": "Inversion Time",
+    "00181314": "Flip Angle",
+}
+
+# The fields to extract, in order, with their tags parsed once at import time
+FIELD_TAGS = tuple((field, hex_string_to_tag(field)) for field in DICOM_FIELD_MAPPING)
+# Map each tag to its column, keyed by pydicom's integer tags so element tags hash the same
+TAG_INDICES = {Tag(tag): index for index, (_, tag) in enumerate(FIELD_TAGS)}
+
+def extract_dicom_info(file_path, tag_indices=TAG_INDICES):
     try:
-        dicom = pydicom.dcmread(file_path, stop_before_pixels=True)
-        info = OrderedDict()
-        for field in fields:
-            tag = hex_string_to_tag(field)
-            if tag in dicom:
-                value = str(dicom[tag].value)
-                info[field] = value
-            else:
-                info[field] = ''
-        return info
+        # Only the requested elements are parsed; everything else is skipped while reading.
+        # A 64 KiB buffer usually holds the whole header, so it takes a single read() syscall.
+        with open(file_path, 'rb', buffering=65536) as f:
+            dicom = pydicom.dcmread(f, stop_before_pixels=True,
+                                    specific_tags=list(tag_indices))
+        # The values are returned as a row in field order, which is lighter to send back from
+        # the worker processes and to keep in memory than a dict per file
+        row = [''] * len(tag_indices)
+        # A single pass over the elements that were read, instead of a lookup per field
+        for elem in dicom:
+            index = tag_indices.get(elem.tag)
+            if index is not None:
+                row[index] = element_to_str(elem)
+        return tuple(row)
+    except InvalidDicomError:
+        return None  # Not a DICOM file
     except Exception as e:
         print(f"Error reading DICOM file {file_path}: {e}")
         return None
 
-def create_dummy_table(output_path, dummy_series, unique_sequences):
+def create_dummy_table(output_path, dummy_series, unique_sequences, fields):
+    patient_index = fields.index("00100020")
+    series_description_index = fields.index("0008103E")
     # Create a map from Patient ID to a defaultdict(int) for counting series descriptions
     patient_series = defaultdict(lambda: defaultdict(int))
     for sequence in unique_sequences.values():
-        patient_id = sequence.get("00100020", "")
-        series_description = sequence.get("0008103E", "")
+        patient_id = sequence[patient_index]
+        series_description = sequence[series_description_index]
         for dummy in dummy_series:
             if dummy in series_description:
                 patient_series[patient_id][dummy] += 1
@@ -59,62 +140,56 @@ def create_dummy_table(output_path, dummy_series, unique_sequences):
 
 
 
-def main(dicom_dir, output_path, read_all=False, dummy_series=None):
-
-
-    # Define a mapping from DICOM tags to descriptive names
-    dicom_field_mapping = {
-        "00100020": "Patient ID",
-        "00080020": "Study Date",
-        "00180087": "Magnetic Field Strength",
-        "00081090": "Manufacturer's Model Name",
-        "00080080": "Institution Name",
-        "00080050": "Accession Number",
-        "0020000D": "Study Instance UID",
-        "00200011": "Series Number",
-        "0008103E": "Series Description",
-        "0020000E": "Series Instance UID",
-        "00540081": "Number of Slices",
-        "00181310": "Acquisition Matrix",
-        "00280030": "Pixel Spacing",
-        "00180088": "Spacing Between Slices",
-        "00180050": "Slice Thickness",
-        "00180080": "Repetition Time",
-        "00180081": "Echo Time",
-        "00180086": "Echo Number(s)",
-        "00180091": "Echo Train Length",
-        "00180082": "Inversion Time",
-        "00181314": "Flip Angle",
-    }
+def main(dicom_dir, output_path, read_all=False, dummy_series=None, fast_sample=False):
+
 
     # The fields to extract, in order
-    fields = list(dicom_field_mapping.keys())
+    fields = [field for field, _ in FIELD_TAGS]
 
     # Header row with descriptive names for each field
-    header_row = list(dicom_field_mapping.values())
+    header_row = list(DICOM_FIELD_MAPPING.values())
+
+    study_uid_index = fields.index("0020000D")
+    series_description_index = fields.index("0008103E")
 
     
     unique_sequences = {}
-    all_files = list(find_dicom_files(dicom_dir, read_all))  # Pass the 'read_all' parameter
+    file_paths = find_dicom_files(dicom_dir, read_all, fast_sample)  # Pass the 'read_all' and 'fast_sample' parameters
+    # Reading just the unique ID tags first lets files of already-seen series skip the full read
+    unique_id_indices = {Tag(FIELD_TAGS[study_uid_index][1]): 0, Tag(FIELD_TAGS[series_description_index][1]): 1}
+    probe = partial(extract_dicom_info, tag_indices=unique_id_indices)
     
-    for file_path in tqdm(all_files, desc="Processing DICOM files"):
-        info = extract_dicom_info(file_path, fields)
-        if info:
-            # Combine Study Instance UID and Series Number to create a unique ID
-            unique_id = (info.get("0020000D", ""), info.get("0008103E", ""))
-            if unique_id not in unique_sequences and all(unique_id):
-                unique_sequences[unique_id] = info
+    # Header parsing is CPU-bound, so spread it over processes; results come back in file order.
+    # Paths are streamed through the pool in batches, so the full file list is never held in memory.
+    with ProcessPoolExecutor() as executor, tqdm(desc="Processing DICOM files", unit="file") as progress_bar:
+        while batch := list(islice(file_paths, FILE_BATCH_SIZE)):
+            # Combine Study Instance UID and Series Description to create a unique ID, and collect
+            # the files of each series not seen yet
+            new_sequences = defaultdict(deque)
+            for file_path, unique_id in zip(batch, executor.map(probe, batch, chunksize=64)):
+                if unique_id and all(unique_id) and unique_id not in unique_sequences:
+                    new_sequences[unique_id].append(file_path)
+
+            # Only the first file of each gets a full header read; if that fails, the next
+            # file of the same series is tried in the following round
+            while new_sequences:
+                new_files = [candidates.popleft() for candidates in new_sequences.values()]
+                for unique_id, info in zip(list(new_sequences), executor.map(extract_dicom_info, new_files, chunksize=8)):
+                    if info:
+                        unique_sequences[unique_id] = info
+                    if info or not new_sequences[unique_id]:
+                        del new_sequences[unique_id]
+            progress_bar.update(len(batch))
 
     # When writing the TSV file
     with open(output_path, 'w', newline='') as tsvfile:
-        writer = csv.DictWriter(tsvfile, fieldnames=fields, delimiter='\t', extrasaction='ignore')
+        writer = csv.writer(tsvfile, delimiter='\t')
         # Write the header row with descriptive names
-        writer.writerow(dict(zip(fields, header_row)))
-        # Now write the data rows
-        for sequence in unique_sequences.values():
-            writer.writerow(sequence)
+        writer.writerow(header_row)
+        # Now write the data rows, which are already in field order
+        writer.writerows(unique_sequences.values())
     if dummy_series:
-        create_dummy_table(output_path, dummy_series, unique_sequences)
+        create_dummy_table(output_path, dummy_series, unique_sequences, fields)
 
 if __name__ == "__main__":
 
@@ -128,6 +203,9 @@ if __name__ == "__main__":
         # Process all DICOM files in the directory:
         python extract_dicom_headers.py --dicom test --output out_test.tsv --read_all
         
+        # Quickly sample a large tree by reading only the first DICOM file in each folder:
+        python extract_dicom_headers.py --dicom test --output out_test.tsv --fast_sample
+        
         # Create a dummy table with specific series descriptions:
         python extract_dicom_headers.py --dicom test --output out_test.tsv --dummy_table T1 "NOMS_VISUAL" "NOMS VISUAL" FLAIR
         
@@ -139,7 +217,9 @@ if __name__ == "__main__":
     # Add arguments
     parser.add_argument("--dicom", required=True, help="Path to the directory containing DICOM files.")
     parser.add_argument("--output", required=True, help="Path to save the output CSV file.")
-    parser.add_argument("--read_all", action='store_true', help="Read all DICOM files in the directory, not just the first 5.")
+    sampling = parser.add_mutually_exclusive_group()
+    sampling.add_argument("--read_all", action='store_true', help="Read all DICOM files in the directory, not just the first 5.")
+    sampling.add_argument("--fast_sample", action='store_true', help="Read only the first DICOM file in each folder, assuming one series per folder.")
     parser.add_argument("--dummy_table", nargs='+', help="Create a dummy table with specified series descriptions, separated by spaces.")
 
     # Parse the arguments
@@ -147,4 +227,4 @@ if __name__ == "__main__":
 
 
 
-    main(args.dicom, args.output, args.read_all, args.dummy_table)
+    main(args.dicom, args.output, args.read_all, args.dummy_table, args.fast_sample)